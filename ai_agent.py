@@ -6,6 +6,8 @@ import base64
 from io import BytesIO
 from PIL import Image
 import requests
+from image_variants import build_variants
+import tracing
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
 TAVILY_API_KEY = os.environ.get('TAVILY_API_KEY')
 STABILITY_API_KEY = os.environ.get('STABILITY_API_KEY')
@@ -15,6 +17,7 @@ from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.tools import Tool
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.messages import HumanMessage, AIMessage
 
 # Initialize LLM
@@ -30,7 +33,7 @@ tavily = TavilySearchResults(api_key=TAVILY_API_KEY)
 # Create the search tool
 search_tool = Tool(
     name="tavily_search",
-    func=tavily.invoke,
+    func=tracing.traced("tavily.search")(tavily.invoke),
     description="Search the web for current information when needed"
 )
 
@@ -42,6 +45,25 @@ Use the search tool for:
 3. Breaking news
 4. Recent scientific breakthroughs"""
 
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Record each Groq LLM call made by the agent as a trace span"""
+
+    def __init__(self):
+        self.spans = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.spans[run_id] = tracing.start_span("groq.llm")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.spans[run_id] = tracing.start_span("groq.llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        tracing.end_span(self.spans.pop(run_id, None))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        tracing.end_span(self.spans.pop(run_id, None))
+
+@tracing.traced("agent.create_executor")
 def create_agent_executor(system_prompt=None):
     """Create a new agent executor with the given system prompt"""
     prompt = ChatPromptTemplate.from_messages([
@@ -64,6 +86,7 @@ def create_agent_executor(system_prompt=None):
         handle_parsing_errors=True
     )
 
+@tracing.traced("ai_agent.ask_ai")
 def ask_ai(question, system_prompt=None, chat_history=None):
     """Process a question through the AI agent"""
     try:
@@ -72,18 +95,11 @@ def ask_ai(question, system_prompt=None, chat_history=None):
         input_data = {"input": question}
         
         if chat_history:
-            formatted_history = []
-            for msg in chat_history:
-                if isinstance(msg, dict):
-                    if msg["role"] == "human":
-                        formatted_history.append(HumanMessage(content=msg["content"]))
-                    elif msg["role"] == "ai":
-                        formatted_history.append(AIMessage(content=msg["content"]))
-                else:
-                    formatted_history.append(AIMessage(content=str(msg)))
-            input_data["chat_history"] = formatted_history
+            with tracing.span("agent.format_history", messages=len(chat_history)):
+                input_data["chat_history"] = format_chat_history(chat_history)
         
-        response = executor.invoke(input_data)
+        with tracing.span("agent.invoke"):
+            response = executor.invoke(input_data, config={"callbacks": [TracingCallbackHandler()]})
         
         return {
             "output": response.get("output", "I couldn't find an answer to that."),
@@ -97,43 +113,62 @@ def ask_ai(question, system_prompt=None, chat_history=None):
             "error": str(e)
         }
 
-def generate_image(prompt):
-    """Generate an image using Stability AI"""
+def format_chat_history(chat_history):
+    """Convert chat history dicts into LangChain messages"""
+    formatted_history = []
+    for msg in chat_history:
+        if isinstance(msg, dict):
+            if msg["role"] == "human":
+                formatted_history.append(HumanMessage(content=msg["content"]))
+            elif msg["role"] == "ai":
+                formatted_history.append(AIMessage(content=msg["content"]))
+        else:
+            formatted_history.append(AIMessage(content=str(msg)))
+    return formatted_history
+
+@tracing.traced("ai_agent.generate_image")
+def generate_image(prompt, variants=None):
+    """Generate an image using Stability AI, encoded into the requested variants"""
     try:
         engine_id = "stable-diffusion-xl-1024-v1-0"
         api_host = "https://api.stability.ai"
         
-        response = requests.post(
-            f"{api_host}/v1/generation/{engine_id}/text-to-image",
-            headers={
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-                "Authorization": f"Bearer {STABILITY_API_KEY}"
-            },
-            json={
-                "text_prompts": [{"text": prompt}],
-                "cfg_scale": 7,
-                "height": 1024,
-                "width": 1024,
-                "samples": 1,
-                "steps": 30,
-            },
-        )
+        with tracing.span("stability.request"):
+            response = requests.post(
+                f"{api_host}/v1/generation/{engine_id}/text-to-image",
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "application/json",
+                    "Authorization": f"Bearer {STABILITY_API_KEY}"
+                },
+                json={
+                    "text_prompts": [{"text": prompt}],
+                    "cfg_scale": 7,
+                    "height": 1024,
+                    "width": 1024,
+                    "samples": 1,
+                    "steps": 30,
+                },
+            )
         
         if response.status_code != 200:
             return {"status": "error", "error": f"API Error: {response.text}"}
             
-        data = response.json()
-        image_data = data["artifacts"][0]["base64"]
+        with tracing.span("stability.parse_response", bytes=len(response.content)):
+            data = response.json()
+            image_data = data["artifacts"][0]["base64"]
+        image_variants = build_variants(image_data, variants)
         
         return {
             "status": "success",
-            "image": image_data,
+            "image_hash": next(iter(image_variants.values()))["image_hash"],
+            "variants": image_variants,
             "prompt": prompt
         }
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
+@tracing.traced("ai_agent.generate_platform_content")
 def generate_platform_content(prompt, platform):
     """Generate content tailored for a specific platform"""
     try:
@@ -148,7 +183,8 @@ def generate_platform_content(prompt, platform):
             
         tailored_prompt = platform_prompts[platform].format(prompt=prompt)
         
-        response = llm.invoke(tailored_prompt)
+        with tracing.span("groq.llm"):
+            response = llm.invoke(tailored_prompt)
         content = response.content if hasattr(response, 'content') else str(response)
         
         return {
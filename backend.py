@@ -1,8 +1,13 @@
 # backend.py
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from typing import List, Optional, Literal
-from fastapi import FastAPI
+from fastapi import FastAPI, Response, Request, Header, HTTPException
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 import uvicorn
+import os
+import hmac
+import tracing
 
 # Create FastAPI app first to avoid circular imports
 app = FastAPI(
@@ -23,6 +28,21 @@ app.add_middleware(
 
 # Import AI functions after app is created
 from ai_agent import ask_ai, generate_image, generate_platform_content
+from image_variants import VARIANTS, get_variant
+
+async def trace_requests(request: Request, call_next):
+    """Trace sampled requests from arrival to response"""
+    if request.url.path.startswith("/admin"):
+        return await call_next(request)
+        
+    with tracing.trace(f"{request.method} {request.url.path}"):
+        response = await call_next(request)
+        tracing.gap_span("response.serialize", after_span=True)
+        return response
+
+# Only pay for the middleware when tracing is turned on
+if tracing.TRACING_ENABLED:
+    app.middleware("http")(trace_requests)
 
 class Message(BaseModel):
     role: str  # "human" or "ai"
@@ -34,10 +54,25 @@ class AIRequest(BaseModel):
     system_prompt: Optional[str] = None
     chat_history: Optional[List[Message]] = None
     platform: Optional[str] = None
+    variant: Literal["thumbnail", "medium", "progressive", "original"] = "original"
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def trace_validation(cls, data, handler):
+        """Time Pydantic validation (including chat_history) as its own span"""
+        tracing.gap_span("request.read_body")
+        with tracing.span("request.validate"):
+            return handler(data)
 
 @app.post("/ai-task")
 def ai_task_endpoint(request: AIRequest):
     """Single endpoint for all AI tasks"""
+    tracing.gap_span("threadpool.wait")
+    with tracing.span("backend.ai_task_endpoint", task=request.task):
+        return handle_ai_task(request)
+
+def handle_ai_task(request: AIRequest):
+    """Dispatch a validated request to the matching AI function"""
     try:
         if request.task == "qa":
             if not request.prompt:
@@ -62,12 +97,19 @@ def ai_task_endpoint(request: AIRequest):
             if not request.prompt:
                 return {"error": "Prompt is required for image generation"}
                 
-            response = generate_image(request.prompt)
+            response = generate_image(request.prompt, variants=[request.variant])
             if response["status"] == "error":
                 return {"error": response["error"], "status": "error"}
                 
+            image = response["variants"][request.variant]
             return {
-                "image": response["image"],
+                "image": image["image"],
+                "image_hash": image["image_hash"],
+                "variant": image["variant"],
+                "mime_type": image["mime_type"],
+                "width": image["width"],
+                "height": image["height"],
+                "encode_ms": image["encode_ms"],
                 "prompt": response["prompt"],
                 "task": "image_generation",
                 "status": "success"
@@ -99,10 +141,71 @@ def ai_task_endpoint(request: AIRequest):
             "status": "error"
         }
 
+@app.get("/image/{image_hash}/{variant}")
+def image_variant_endpoint(image_hash: str, variant: str):
+    """Serve a variant of a previously generated image"""
+    if variant not in VARIANTS:
+        raise HTTPException(status_code=404, detail="Unknown image variant")
+        
+    try:
+        image = get_variant(image_hash, variant)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing your request: {str(e)}")
+        
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+        
+    data, mime_type, encode_ms = image
+    return Response(
+        content=data,
+        media_type=mime_type,
+        headers={"X-Encode-Ms": str(round(encode_ms, 2))}
+    )
+
+def check_admin_token(token):
+    """Reject the request unless the admin token matches ADMIN_TOKEN"""
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not token or not hmac.compare_digest(token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.get("/admin/traces")
+def traces_endpoint(x_admin_token: Optional[str] = Header(None)):
+    """Return the sampled traces currently in the ring buffer"""
+    check_admin_token(x_admin_token)
+    return {"traces": tracing.get_traces(), "status": "success"}
+
+@app.post("/admin/traces/export")
+def export_traces_endpoint(x_admin_token: Optional[str] = Header(None)):
+    """Write the sampled traces to the JSON export file"""
+    check_admin_token(x_admin_token)
+    try:
+        return {**tracing.export_traces(), "status": "success"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error exporting traces: {str(e)}")
+
+@app.post("/admin/profile")
+def profile_endpoint(seconds: float = 10, x_admin_token: Optional[str] = Header(None)):
+    """Run the sampling CPU profiler and return a collapsed-stack flamegraph file"""
+    check_admin_token(x_admin_token)
+    try:
+        path = tracing.profile(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error running profiler: {str(e)}")
+        
+    return FileResponse(
+        path,
+        media_type="text/plain",
+        filename=os.path.basename(path),
+        background=BackgroundTask(os.remove, path)
+    )
+
 
 # Replace the __main__ block in backend.py with:
 if __name__ == "__main__":
-    import os
     uvicorn.run(
         app,
         host="0.0.0.0",
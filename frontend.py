@@ -1,8 +1,6 @@
 # frontend.py
 import streamlit as st
 from datetime import datetime
-from PIL import Image
-from io import BytesIO
 import base64
 from ai_agent import ask_ai, generate_image, generate_platform_content
 
@@ -187,7 +185,7 @@ if send_button and user_input.strip():
                     })
                     
             elif st.session_state.task_type == "image_generation":
-                response = generate_image(user_input)
+                response = generate_image(user_input, variants=["medium", "original"])
                 if response["status"] == "success":
                     st.session_state.last_image = response
                     
@@ -230,14 +228,12 @@ if st.session_state.task_type == "qa" and st.session_state.messages:
 
 elif st.session_state.task_type == "image_generation" and hasattr(st.session_state, "last_image"):
     st.markdown("### 🖼️ Generated Image")
-    image_data = base64.b64decode(st.session_state.last_image["image"])
-    image = Image.open(BytesIO(image_data))
-    st.image(image, caption=st.session_state.last_image["prompt"])
+    variants = st.session_state.last_image["variants"]
+    preview = base64.b64decode(variants["medium"]["image"])
+    st.image(preview, caption=st.session_state.last_image["prompt"])
     
     # Download button
-    buf = BytesIO()
-    image.save(buf, format="PNG")
-    byte_im = buf.getvalue()
+    byte_im = base64.b64decode(variants["original"]["image"])
     st.download_button(
         label="Download Image",
         data=byte_im,
@@ -0,0 +1,261 @@
+# image_variants.py
+import os
+import base64
+import hashlib
+import time
+import atexit
+from io import BytesIO
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from PIL import Image, ImageFilter
+import tracing
+
+# Variant name -> encoding settings. "size" is the longest edge in pixels,
+# None keeps the source dimensions.
+VARIANTS = {
+    "thumbnail": {
+        "size": int(os.environ.get("IMAGE_THUMBNAIL_SIZE", 128)),
+        "format": "WEBP",
+        "quality": 70,
+    },
+    "medium": {
+        "size": int(os.environ.get("IMAGE_MEDIUM_SIZE", 512)),
+        "format": "WEBP",
+        "quality": 80,
+    },
+    "progressive": {
+        "size": None,
+        "format": "JPEG",
+        "quality": 85,
+        "progressive": True,
+    },
+    "original": {
+        "size": None,
+        "format": "PNG",
+    },
+}
+
+DEFAULT_VARIANTS = ["thumbnail", "medium", "original"]
+
+MIME_TYPES = {
+    "WEBP": "image/webp",
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+}
+
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+_pool = None
+_pool_lock = Lock()
+
+# (image hash, variant, size) -> (data, size, encode_ms), evicted oldest first
+# once the total data size exceeds CACHE_MAX_BYTES. The "original" entry
+# doubles as the source for variants requested later.
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = Lock()
+
+
+def _get_pool():
+    """Create the encoder process pool on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking the threaded Streamlit/uvicorn/MCP processes can deadlock the workers
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context(method)
+            )
+            atexit.register(_pool.shutdown, wait=False)
+        return _pool
+
+
+def _reset_pool(broken):
+    """Drop a pool whose worker died so the next call starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _encode_pending(source, names):
+    """Encode variants in the worker pool, retrying once on a fresh pool if a worker died"""
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            futures = {name: pool.submit(_encode_variant, source, VARIANTS[name]) for name in names}
+            return {name: future.result() for name, future in futures.items()}
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            if attempt:
+                raise
+
+
+def _encode_variant(source, spec):
+    """Resize and encode PNG bytes according to spec (runs in a worker process)"""
+    start = time.perf_counter()
+    image = Image.open(BytesIO(source))
+    image.load()
+
+    size = spec.get("size")
+    if size and max(image.size) > size:
+        image.thumbnail((size, size), Image.LANCZOS)
+
+    if spec["format"] == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    options = {}
+    if "quality" in spec:
+        options["quality"] = spec["quality"]
+    if spec.get("progressive"):
+        options["progressive"] = True
+        options["optimize"] = True
+
+    buf = BytesIO()
+    image.save(buf, format=spec["format"], **options)
+    encode_ms = (time.perf_counter() - start) * 1000
+    return buf.getvalue(), image.size, encode_ms
+
+
+def _is_passthrough(source, spec):
+    """Check whether the source can be served as-is for this variant"""
+    return spec["format"] == "PNG" and not spec.get("size") and source[:8] == b"\x89PNG\r\n\x1a\n"
+
+
+def _cache_key(image_hash, name):
+    return (image_hash, name, VARIANTS[name].get("size"))
+
+
+def _lookup(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+        return entry
+
+
+def _remember(key, entry):
+    """Cache an encoded variant, evicting old entries to stay under CACHE_MAX_BYTES"""
+    global _cache_bytes
+    size = len(entry[0])
+    if size > CACHE_MAX_BYTES:
+        return
+    with _cache_lock:
+        previous = _cache.pop(key, None)
+        if previous is not None:
+            _cache_bytes -= len(previous[0])
+        _cache[key] = entry
+        _cache_bytes += size
+        while _cache_bytes > CACHE_MAX_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted[0])
+
+
+def _result(image_hash, name, spec, data, size, encode_ms, cached):
+    return {
+        "image": base64.b64encode(data).decode("ascii"),
+        "image_hash": image_hash,
+        "variant": name,
+        "format": spec["format"].lower(),
+        "mime_type": MIME_TYPES[spec["format"]],
+        "width": size[0],
+        "height": size[1],
+        "bytes": len(data),
+        "encode_ms": round(encode_ms, 2),
+        "cached": cached,
+    }
+
+
+def _build(source, image_hash, names):
+    """Build variants of raw image bytes, returning name -> (data, size, encode_ms, cached)"""
+    results = {}
+    pending = {}
+    # Always keep the original so other variants can be built on demand later
+    for name in dict.fromkeys(list(names) + ["original"]):
+        spec = VARIANTS[name]
+        key = _cache_key(image_hash, name)
+        entry = _lookup(key)
+        if entry is not None:
+            results[name] = (*entry, True)
+        elif _is_passthrough(source, spec):
+            with Image.open(BytesIO(source)) as image:
+                entry = (source, image.size, 0.0)
+            _remember(key, entry)
+            results[name] = (*entry, False)
+        else:
+            pending[name] = key
+
+    if pending:
+        # Variants encode in parallel, so this span is the wait for all of them;
+        # the worker-measured time per variant is attached as encode_ms.<name>
+        with tracing.span("image.wait_encode", variants=",".join(pending)):
+            encoded = _encode_pending(source, pending)
+            for name in pending:
+                tracing.set_attribute(f"encode_ms.{name}", round(encoded[name][2], 2))
+        for name, key in pending.items():
+            _remember(key, encoded[name])
+            results[name] = (*encoded[name], False)
+
+    return {name: results[name] for name in names}
+
+
+@tracing.traced("image.build_variants")
+def build_variants(image_b64, variants=None):
+    """Build the requested variants of a base64 PNG, reusing cached encodings"""
+    names = variants or DEFAULT_VARIANTS
+    unknown = [name for name in names if name not in VARIANTS]
+    if unknown:
+        raise ValueError(f"Unknown image variant(s): {', '.join(unknown)}")
+
+    with tracing.span("image.decode_base64", bytes=len(image_b64)):
+        source = base64.b64decode(image_b64)
+        image_hash = hashlib.sha256(source).hexdigest()
+
+    return {
+        name: _result(image_hash, name, VARIANTS[name], *entry)
+        for name, entry in _build(source, image_hash, names).items()
+    }
+
+
+def get_variant(image_hash, variant):
+    """Return (data, mime_type, encode_ms) for a cached image, or None if it is not cached"""
+    entry = _lookup(_cache_key(image_hash, variant))
+    if entry is None:
+        original = _lookup(_cache_key(image_hash, "original"))
+        if original is None:
+            return None
+        entry = _build(original[0], image_hash, [variant])[variant]
+    data, _, encode_ms = entry[:3]
+    return data, MIME_TYPES[VARIANTS[variant]["format"]], encode_ms
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Benchmark encode time and payload size per variant
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            sample = f.read()
+    else:
+        # Blurred colour noise compresses roughly like a generated photo
+        noise = Image.merge("RGB", [Image.effect_noise((1024, 1024), 64) for _ in range(3)])
+        buf = BytesIO()
+        noise.filter(ImageFilter.GaussianBlur(2)).save(buf, format="PNG")
+        sample = buf.getvalue()
+
+    sample_b64 = base64.b64encode(sample).decode("ascii")
+    original_bytes = len(sample)
+    for name in VARIANTS:
+        result = build_variants(sample_b64, [name])[name]
+        print(
+            f"{name:12} {result['width']}x{result['height']:<5} "
+            f"{result['bytes']:>9} bytes  "
+            f"{original_bytes / result['bytes']:6.1f}x smaller  "
+            f"{result['encode_ms']:8.2f} ms"
+        )
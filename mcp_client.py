@@ -7,7 +7,7 @@ class MCPClient:
         self.host = host
         self.port = port
 
-    def send_request(self, task, prompt, system_prompt=None, platform=None):
+    def send_request(self, task, prompt, system_prompt=None, platform=None, variant=None):
         try:
             request = {
                 "task": task,
@@ -18,6 +18,8 @@ class MCPClient:
                 request["system_prompt"] = system_prompt
             if platform:
                 request["platform"] = platform
+            if variant:
+                request["variant"] = variant
 
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 s.connect((self.host, self.port))
@@ -42,7 +44,8 @@ if __name__ == "__main__":
     # Image Generation Example
     response = client.send_request(
         task="image_generation",
-        prompt="A beautiful sunset over mountains"
+        prompt="A beautiful sunset over mountains",
+        variant="thumbnail"
     )
     print("Image Generation Response:", response)
     
@@ -4,6 +4,7 @@ import json
 from threading import Thread
 import uvicorn
 from ai_agent import ask_ai, generate_image, generate_platform_content
+import tracing
 
 class MCPServer:
     def __init__(self, host='127.0.0.1', port=8004):
@@ -28,6 +29,10 @@ class MCPServer:
             client_socket.close()
 
     def process_request(self, request):
+        with tracing.trace(f"mcp {request.get('task')}"):
+            return self._process_request(request)
+
+    def _process_request(self, request):
         try:
             task = request.get('task')
             
@@ -43,9 +48,14 @@ class MCPServer:
                 }
                 
             elif task == 'image_generation':
-                result = generate_image(request.get('prompt'))
+                variant = request.get('variant', 'original')
+                result = generate_image(request.get('prompt'), variants=[variant])
+                if result["status"] == "error":
+                    return result
                 return {
-                    "image": result["image"],
+                    "image": result["variants"][variant]["image"],
+                    "image_hash": result["image_hash"],
+                    "variant": variant,
                     "status": "success"
                 }
                 
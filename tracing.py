@@ -0,0 +1,292 @@
+# tracing.py
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import atexit
+import tempfile
+import threading
+from collections import deque, Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0.1))
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", 200))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "traces.json")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", tempfile.gettempdir())
+MAX_PROFILE_SECONDS = 60
+
+# Innermost frames of threads that are blocked waiting rather than using CPU,
+# used only where per-thread CPU clocks are unavailable
+IDLE_FRAMES = {
+    "threading:wait",
+    "threading:_wait_for_tstate_lock",
+    "selectors:select",
+    "queue:get",
+    "thread:_worker",
+    "socket:accept",
+    "socket:recv",
+    "socket:recv_into",
+    "socket:readinto",
+    "ssl:read",
+}
+
+_traces = deque(maxlen=TRACE_BUFFER_SIZE)
+_traces_lock = threading.Lock()
+_profile_lock = threading.Lock()
+
+_current_trace = ContextVar("current_trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """A sampled request trace made of timed spans"""
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.last_end = self.start
+        self.spans = []
+        self.attributes = {}
+        self.lock = threading.Lock()
+
+    def add_span(self, span):
+        with self.lock:
+            self.spans.append(span)
+            self.last_end = max(self.last_end, span.end)
+
+    def to_dict(self, duration):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(duration * 1000, 3),
+            "attributes": self.attributes,
+            "spans": [span.to_dict(self.start) for span in self.spans],
+        }
+
+
+class Span:
+    """A single timed operation inside a trace"""
+
+    def __init__(self, name, parent=None, start=None, attributes=None):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.parent_id = parent.span_id if parent else None
+        self.start = start if start is not None else time.perf_counter()
+        self.end = None
+        self.attributes = attributes or {}
+
+    def to_dict(self, origin):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((self.end - self.start) * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+class _NoopContext:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopContext()
+
+
+@contextmanager
+def _sampled_trace(name, attributes):
+    trace = Trace(name)
+    trace.attributes.update(attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    except Exception as e:
+        trace.attributes["error"] = str(e)
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        record = trace.to_dict(time.perf_counter() - trace.start)
+        with _traces_lock:
+            _traces.append(record)
+
+
+def trace(name, **attributes):
+    """Start a new trace if tracing is enabled and the request is sampled"""
+    if not TRACING_ENABLED or _current_trace.get() is not None:
+        return _NOOP
+    if random.random() >= TRACE_SAMPLE_RATE:
+        return _NOOP
+    return _sampled_trace(name, attributes)
+
+
+def start_span(name, **attributes):
+    """Open a span in the current trace, returning None when not tracing"""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    span = Span(name, parent=_current_span.get(), attributes=attributes)
+    span.trace = trace
+    return span
+
+
+def end_span(span):
+    """Close a span returned by start_span"""
+    if span is None:
+        return
+    span.end = time.perf_counter()
+    span.trace.add_span(span)
+
+
+@contextmanager
+def _active_span(trace, name, attributes):
+    span = Span(name, parent=_current_span.get(), attributes=attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.attributes["error"] = str(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end = time.perf_counter()
+        trace.add_span(span)
+
+
+def span(name, **attributes):
+    """Time a block of code as a span of the current trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    return _active_span(trace, name, attributes)
+
+
+def gap_span(name, after_span=False, **attributes):
+    """Record the time since the last finished span (or the trace start) as a span.
+
+    With after_span=True nothing is recorded unless the trace already has spans.
+    """
+    trace = _current_trace.get()
+    if trace is None or (after_span and not trace.spans):
+        return
+    gap = Span(name, parent=_current_span.get(), start=trace.last_end, attributes=attributes)
+    gap.end = time.perf_counter()
+    trace.add_span(gap)
+
+
+def set_attribute(key, value):
+    """Attach an attribute to the current span, or the trace if no span is open"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    current = _current_span.get()
+    (current or trace).attributes[key] = value
+
+
+def traced(name=None):
+    """Decorator that records each call of the function as a span"""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            with _active_span(trace, span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_traces():
+    """Return a snapshot of the sampled trace buffer, oldest first"""
+    with _traces_lock:
+        return list(_traces)
+
+
+def export_traces(path=None):
+    """Write the sampled trace buffer to a JSON file"""
+    path = path or TRACE_EXPORT_PATH
+    traces = get_traces()
+    with open(path, "w") as f:
+        json.dump(traces, f, indent=2)
+    return {"path": os.path.abspath(path), "count": len(traces)}
+
+
+if TRACING_ENABLED:
+    atexit.register(export_traces)
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        stack.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    return stack
+
+
+def _thread_cpu_time(thread_id):
+    """Return the CPU time used by a thread, or None if it cannot be read"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+def profile(seconds, interval=0.005):
+    """Sample on-CPU thread stacks for the given duration and write a collapsed-stack file.
+
+    A stack is recorded only when its thread used CPU since the previous
+    sample, so threads sleeping or blocked in I/O are left out. Where per-thread
+    CPU clocks are unavailable, threads whose innermost frame is in IDLE_FRAMES
+    are skipped instead. Only threads of this process are sampled, so image
+    encoding in the image_variants worker processes does not appear; see the
+    encode_ms attributes on image.wait_encode spans instead.
+    """
+    seconds = min(max(float(seconds), 0.1), MAX_PROFILE_SECONDS)
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+
+    try:
+        samples = Counter()
+        cpu_times = {}
+        own_id = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                cpu_time = _thread_cpu_time(thread_id)
+                stack = _collapse(frame)
+                if cpu_time is None:
+                    busy = bool(stack) and stack[0] not in IDLE_FRAMES
+                else:
+                    busy = thread_id in cpu_times and cpu_time > cpu_times[thread_id]
+                    cpu_times[thread_id] = cpu_time
+                if busy:
+                    samples[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+
+        path = os.path.join(PROFILE_DIR, f"profile-{int(time.time())}.folded")
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+    finally:
+        _profile_lock.release()